@@ -90,6 +90,7 @@ export default function App() {
         body: JSON.stringify({
           text: inputText,
           type: inputMode,
+          debug: true,
         }),
       });
 
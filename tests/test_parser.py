@@ -1,6 +1,10 @@
-﻿import unittest
+﻿import importlib.util
+import io
+import json
+import unittest
+from pathlib import Path
 
-from api.generate import FlexibleParser, process_input
+from api.generate import FlexibleParser, handler, process_input
 
 
 TEST_CASES = [
@@ -83,7 +87,7 @@ class FlexibleParserSpecTests(unittest.TestCase):
     def test_parser_cases(self) -> None:
         for case in TEST_CASES:
             with self.subTest(case=case["name"]):
-                parser = FlexibleParser()
+                parser = FlexibleParser(debug=True)
                 product_info = parser.parse(case["input"])
                 logs = parser.logs
                 expected = case["expected"]
@@ -126,6 +130,24 @@ class FlexibleParserSpecTests(unittest.TestCase):
                 # Ensure parse never raises and returns ProductInfo
                 self.assertIsNotNone(product_info)
 
+    def test_long_inputs_parse_in_linear_time(self) -> None:
+        # Guards against quadratic rescans; the ※ note case used to take minutes.
+        cases = [
+            "■商品名:テスト\n※" + "注意" * 45_000,
+            "商品名:テスト\n" + "あ" * 99_000,
+            "a:b\n" * 24_000,
+        ]
+        for text in cases:
+            with self.subTest(length=len(text)):
+                product_info = FlexibleParser().parse(text)
+                self.assertIsNotNone(product_info)
+
+    def test_allergen_note_does_not_swallow_following_fields(self) -> None:
+        text = "■商品名:テスト\n※本品は小麦・乳を含みます\n■製造者:株式会社テスト\n■保存方法:常温"
+        product_info = FlexibleParser().parse(text)
+        self.assertEqual(product_info.allergen, "本品は小麦・乳を含みます")
+        self.assertEqual(product_info.manufacturer, "株式会社テスト")
+
 
 class ProcessInputTests(unittest.TestCase):
     def test_process_input_structure(self) -> None:
@@ -139,10 +161,51 @@ class ProcessInputTests(unittest.TestCase):
 
     def test_process_input_csv(self) -> None:
         csv_content = "項目名,値\n商品名,テスト商品\n名称,スイーツ\nエネルギー,120\n"
-        result = process_input(csv_content, "csv")
+        result = process_input(csv_content, "csv", debug=True)
         self.assertTrue(result["success"])
         self.assertEqual(result["product_info"].get("product_name"), "テスト商品")
         self.assertGreater(len(result["logs"]), 0)
+
+    def test_process_input_repeated_submission_returns_independent_copy(self) -> None:
+        first = process_input(TEST_CASES[1]["input"], "text")
+        first.pop("status_code")
+        first["html"]["rakuten_pc"] = ""
+        second = process_input(TEST_CASES[1]["input"], "text")
+        self.assertEqual(second["status_code"], 200)
+        self.assertNotEqual(second["html"]["rakuten_pc"], "")
+        self.assertEqual(second["product_info"], first["product_info"])
+
+    def test_process_input_returns_only_requested_variants(self) -> None:
+        result = process_input(TEST_CASES[0]["input"], "text", ["yahoo_sp"])
+        self.assertTrue(result["success"])
+        self.assertEqual(list(result["html"]), ["yahoo_sp"])
+        full = process_input(TEST_CASES[0]["input"], "text")
+        self.assertEqual(result["html"]["yahoo_sp"], full["html"]["yahoo_sp"])
+
+        result = process_input(TEST_CASES[0]["input"], "text", ["amazon_pc"])
+        self.assertFalse(result["success"])
+        self.assertEqual(result["status_code"], 400)
+
+        for variants in ([["yahoo_sp"]], [{"x": 1}]):
+            result = process_input(TEST_CASES[0]["input"], "text", variants)
+            self.assertFalse(result["success"])
+            self.assertEqual(result["status_code"], 400)
+
+    def test_process_input_omits_parser_logs_unless_debug(self) -> None:
+        result = process_input(TEST_CASES[0]["input"], "text")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["logs"], [])
+        debug_result = process_input(TEST_CASES[0]["input"], "text", debug=True)
+        self.assertGreater(len(debug_result["logs"]), 0)
+        self.assertEqual(debug_result["html"], result["html"])
+
+    def test_process_input_does_not_repeat_synonym_labels(self) -> None:
+        text = "品名:宇治抹茶\n\n原材料名:緑茶(国産)\n\n内容量:200g\n\n販売者:株式会社天然生活"
+        result = process_input(text, "text")
+        yahoo_pc = result["html"]["yahoo_pc"]
+        self.assertEqual(yahoo_pc.count("原材料"), 1)
+        self.assertEqual(yahoo_pc.count("内容量"), 1)
+
     def test_process_input_dangerous_html_returns_400(self) -> None:
         result = process_input("<script>alert(1)</script>", "text")
         self.assertFalse(result["success"])
@@ -151,5 +214,63 @@ class ProcessInputTests(unittest.TestCase):
 
 
 
+class _RecordingHandler(handler):
+    """Runs do_POST against in-memory streams instead of a socket."""
+
+    def __init__(self, body: bytes) -> None:
+        self.headers = {"Content-Length": str(len(body))}
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.status = None
+
+    def send_response(self, code, message=None) -> None:
+        self.status = code
+
+    def send_header(self, keyword, value) -> None:
+        pass
+
+    def end_headers(self) -> None:
+        pass
+
+
+def _post(payload: dict):
+    request = _RecordingHandler(json.dumps(payload).encode("utf-8"))
+    request.do_POST()
+    return request.status, json.loads(request.wfile.getvalue())
+
+
+class HandlerTests(unittest.TestCase):
+    def test_debug_only_enabled_by_json_true(self) -> None:
+        text = TEST_CASES[0]["input"]
+        status, body = _post({"text": text, "debug": "false"})
+        self.assertEqual(status, 200)
+        self.assertEqual(body["logs"], [])
+        status, body = _post({"text": text, "debug": True})
+        self.assertEqual(status, 200)
+        self.assertGreater(len(body["logs"]), 0)
+
+
+def _load_duplicate_check_script():
+    path = Path(__file__).resolve().parent.parent / "一時作業" / "csv_processor" / "test_duplicate.py"
+    spec = importlib.util.spec_from_file_location("duplicate_check_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class DuplicateCheckScriptTests(unittest.TestCase):
+    def test_iter_descriptions_skips_blank_lines(self) -> None:
+        script = _load_duplicate_check_script()
+        content = (
+            "商品番号,PC用商品説明文,スマートフォン用商品説明文\n"
+            "A,pc-a,sp-a\n"
+            "\n"
+            "B,pc-b\n"
+            "\n"
+        )
+        pairs = list(script.iter_descriptions(io.StringIO(content, newline="")))
+        self.assertEqual(pairs, [("pc-a", "sp-a"), ("pc-b", "")])
+
+
 if __name__ == "__main__":
     unittest.main()
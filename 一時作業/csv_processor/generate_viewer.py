@@ -7,14 +7,8 @@ import csv
 from pathlib import Path
 import html as html_module
 
-def generate_viewer_html(csv_path, output_html_path):
-    """CSVからHTMLビューアーを生成"""
-
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    html_content = """<!DOCTYPE html>
+# ページ先頭（スタイルと見出し）
+VIEWER_HEADER = """<!DOCTYPE html>
 <html lang="ja">
 <head>
     <meta charset="UTF-8">
@@ -169,16 +163,8 @@ def generate_viewer_html(csv_path, output_html_path):
         <h1>📄 HTML生成結果ビューアー</h1>
 """
 
-    for idx, row in enumerate(rows, 1):
-        product_name = html_module.escape(row.get('メインデータの商品名', ''))
-        product_code = html_module.escape(row.get('メインデータの商品コード（楽天URL）', ''))
-
-        rakuten_pc = row.get('楽天パソコン', '')
-        rakuten_sp = row.get('楽天スマホ', '')
-        yahoo_pc = row.get('Yahooパソコン', '')
-        yahoo_sp = row.get('Yahooスマホ', '')
-
-        html_content += f"""
+# 商品1件分のブロック。{idx} などはformat_mapで埋める
+ROW_TEMPLATE = """
         <div class="product-item">
             <div class="product-header" onclick="toggleProduct({idx})">
                 <div>
@@ -203,7 +189,7 @@ def generate_viewer_html(csv_path, output_html_path):
                     <div class="code-section">
                         <h3>HTMLコード</h3>
                         <div class="code-content">
-                            <pre>{html_module.escape(rakuten_pc)}</pre>
+                            <pre>{rakuten_pc_escaped}</pre>
                             <button class="copy-button" onclick="copyCode(this, {idx}, 'rakuten-pc')">コピー</button>
                         </div>
                     </div>
@@ -217,7 +203,7 @@ def generate_viewer_html(csv_path, output_html_path):
                     <div class="code-section">
                         <h3>HTMLコード</h3>
                         <div class="code-content">
-                            <pre>{html_module.escape(rakuten_sp)}</pre>
+                            <pre>{rakuten_sp_escaped}</pre>
                             <button class="copy-button" onclick="copyCode(this, {idx}, 'rakuten-sp')">コピー</button>
                         </div>
                     </div>
@@ -231,7 +217,7 @@ def generate_viewer_html(csv_path, output_html_path):
                     <div class="code-section">
                         <h3>HTMLコード</h3>
                         <div class="code-content">
-                            <pre>{html_module.escape(yahoo_pc)}</pre>
+                            <pre>{yahoo_pc_escaped}</pre>
                             <button class="copy-button" onclick="copyCode(this, {idx}, 'yahoo-pc')">コピー</button>
                         </div>
                     </div>
@@ -245,7 +231,7 @@ def generate_viewer_html(csv_path, output_html_path):
                     <div class="code-section">
                         <h3>HTMLコード</h3>
                         <div class="code-content">
-                            <pre>{html_module.escape(yahoo_sp)}</pre>
+                            <pre>{yahoo_sp_escaped}</pre>
                             <button class="copy-button" onclick="copyCode(this, {idx}, 'yahoo-sp')">コピー</button>
                         </div>
                     </div>
@@ -254,7 +240,8 @@ def generate_viewer_html(csv_path, output_html_path):
         </div>
 """
 
-    html_content += """
+# ページ末尾（タブ切り替え・コピー用のスクリプト）
+VIEWER_FOOTER = """
     </div>
 
     <script>
@@ -301,11 +288,48 @@ def generate_viewer_html(csv_path, output_html_path):
 </html>
 """
 
-    with open(output_html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+def render_viewer_row(idx, row):
+    """処理結果の1行（辞書）から商品1件分のブロックを生成"""
+    product_name = html_module.escape(row.get('メインデータの商品名', ''))
+    product_code = html_module.escape(row.get('メインデータの商品コード（楽天URL）', ''))
+
+    rakuten_pc = row.get('楽天パソコン', '')
+    rakuten_sp = row.get('楽天スマホ', '')
+    yahoo_pc = row.get('Yahooパソコン', '')
+    yahoo_sp = row.get('Yahooスマホ', '')
+
+    return ROW_TEMPLATE.format_map({
+        'idx': idx,
+        'product_name': product_name,
+        'product_code': product_code,
+        'rakuten_pc': rakuten_pc,
+        'rakuten_sp': rakuten_sp,
+        'yahoo_pc': yahoo_pc,
+        'yahoo_sp': yahoo_sp,
+        # <pre>の中身は属性値ではないので引用符のエスケープは不要
+        'rakuten_pc_escaped': html_module.escape(rakuten_pc, quote=False),
+        'rakuten_sp_escaped': html_module.escape(rakuten_sp, quote=False),
+        'yahoo_pc_escaped': html_module.escape(yahoo_pc, quote=False),
+        'yahoo_sp_escaped': html_module.escape(yahoo_sp, quote=False),
+    })
+
+def write_viewer_html(rows, output_html_path):
+    """行（辞書）のイテラブルからHTMLビューアーを生成"""
+
+    # 全体を文字列に組み立てず、受け取った行から順にファイルへ書き出す
+    with open(output_html_path, 'w', encoding='utf-8') as f_out:
+        f_out.write(VIEWER_HEADER)
+        for idx, row in enumerate(rows, 1):
+            f_out.write(render_viewer_row(idx, row))
+        f_out.write(VIEWER_FOOTER)
 
     print(f"ビューアーを生成しました: {output_html_path}")
 
+def generate_viewer_html(csv_path, output_html_path):
+    """CSVからHTMLビューアーを生成"""
+    with open(csv_path, 'r', encoding='utf-8') as f_in:
+        write_viewer_html(csv.DictReader(f_in), output_html_path)
+
 if __name__ == '__main__':
     script_dir = Path(__file__).parent
     csv_path = script_dir / 'output_result.csv'
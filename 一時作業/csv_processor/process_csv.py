@@ -5,49 +5,146 @@ CSVファイルを読み込み、楽天・Yahoo!用のHTMLを生成するスク
 """
 import sys
 import os
+import argparse
 import csv
 import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
 # 親ディレクトリのapiモジュールをインポート
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'api'))
-from generate import FlexibleParser, HTMLGenerator
+from generate import FlexibleParser, HTMLGenerator, ProductInfo
+from generate_viewer import VIEWER_FOOTER, VIEWER_HEADER, render_viewer_row
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_INPUT_CSV = SCRIPT_DIR.parent / '無題のスプレッドシート のコピー - ir-itemsub_楽天_美味セレクト楽天市場店 (9).csv'
+DEFAULT_OUTPUT_CSV = SCRIPT_DIR / 'output_result.csv'
+DEFAULT_VIEWER_HTML = SCRIPT_DIR / 'viewer.html'
+
+# HTMLGeneratorは行ごとの状態を持たないので、全行で1つを使い回す
+_GENERATOR = HTMLGenerator()
+
+# 行ごとに使うパターンは読み込み時に一度だけコンパイルする
+# 標準の re のままにしている（re2 / regex は依存に含めない）。
+# 並列化は --workers のプロセスで行うのでGILの影響は受けず、
+# バックトラックが爆発しうる行の抽出は scan_table_rows の線形走査に置き換え済み。
+IMAGE_LINK_PATTERN = re.compile(r'(<a[^>]*>.*?</a>|<img[^>]*>)', re.DOTALL | re.IGNORECASE)
+TABLE_START_PATTERN = re.compile(r'<table', re.IGNORECASE)
+TABLE_PATTERN = re.compile(r'<table[^>]*>(.*?)</table>', re.DOTALL | re.IGNORECASE)
+ANCHOR_PATTERN = re.compile(r'<a[^>]*>.*?</a>', re.DOTALL | re.IGNORECASE)
+IMG_PATTERN = re.compile(r'<img[^>]*>', re.IGNORECASE)
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# 栄養成分の行とみなすキーワード（1回のsearchでまとめて判定する）
+NUTRITION_KEYWORDS = ['エネルギー', 'たんぱく質', 'タンパク質', '脂質', '炭水化物', '食塩', 'ナトリウム', '糖質', '食物繊維']
+NUTRITION_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, NUTRITION_KEYWORDS)))
 
 def extract_images_and_links(html_text):
     """D列から画像とリンクのHTMLを抽出"""
     if not html_text:
         return ""
 
-    # <a>タグと<img>タグを抽出（商品説明の前の部分）
-    pattern = r'(<a[^>]*>.*?</a>|<img[^>]*>)'
-    matches = re.findall(pattern, html_text, re.DOTALL | re.IGNORECASE)
-
-    # tableタグより前の部分のみを対象にする
-    table_pos = html_text.lower().find('<table')
-    if table_pos > 0:
-        prefix_html = html_text[:table_pos]
-        matches = re.findall(pattern, prefix_html, re.DOTALL | re.IGNORECASE)
+    # <a>タグと<img>タグを抽出（tableタグより前の部分のみを対象にする）
+    # 全文を小文字化したコピーは作らず、大文字小文字を無視した検索で位置を得る
+    table_start = TABLE_START_PATTERN.search(html_text)
+    table_pos = table_start.start() if table_start else -1
+    target_html = html_text[:table_pos] if table_pos > 0 else html_text
+    matches = IMAGE_LINK_PATTERN.findall(target_html)
 
     return '\n'.join(matches)
 
+def scan_table_rows(table_html):
+    """<tr>内の最初の<th>と<td>の中身を (th, td) の組で返す
+
+    以前の正規表現 r'<tr[^>]*>.*?<th[^>]*>(.*?)</th>.*?<td[^>]*>(.*?)</td>.*?</tr>'
+    （DOTALL・IGNORECASE）の findall と同じ結果になるが、</tr> の欠けた表でも
+    後戻りせず線形時間で終わる（正規表現では250行で数分以上かかっていた）。
+    """
+    # 区切りは小文字化したコピーから str.find で探し、同じ位置で元の文字列を切り出す。
+    # İ など小文字化で長さが変わる文字があるときは、その文字だけそのまま残して位置を揃える。
+    haystack = table_html.lower()
+    if len(haystack) != len(table_html):
+        haystack = ''.join(c.lower() if len(c.lower()) == 1 else c for c in table_html)
+
+    rows = []
+    pos = 0
+    while True:
+        # どの段も「pos以降で最初に現れる区切り」を取る。見つからなければ、
+        # それより後ろから始めても見つからないので、そこで走査を終える。
+        pos = haystack.find('<tr', pos)
+        if pos < 0:
+            break
+        pos = haystack.find('>', pos + 3)
+        if pos < 0:
+            break
+        pos = haystack.find('<th', pos + 1)
+        if pos < 0:
+            break
+        label_start = haystack.find('>', pos + 3) + 1
+        if label_start == 0:
+            break
+        label_end = haystack.find('</th>', label_start)
+        if label_end < 0:
+            break
+        pos = haystack.find('<td', label_end + 5)
+        if pos < 0:
+            break
+        value_start = haystack.find('>', pos + 3) + 1
+        if value_start == 0:
+            break
+        value_end = haystack.find('</td>', value_start)
+        if value_end < 0:
+            break
+        pos = haystack.find('</tr>', value_end + 5)
+        if pos < 0:
+            break
+        rows.append((table_html[label_start:label_end], table_html[value_start:value_end]))
+        pos += 5
+    return rows
+
+# 類似ラベルの統一先
+LABEL_MAPPINGS = {
+    '原材料名': '原材料',
+    '品名': '商品名',
+    '内容量': '容量',
+    '賞味期限': '賞味期限',
+    '保存方法': '保存方法',
+    '販売者': '販売者',
+}
+
+def _match_label_mapping(label):
+    """LABEL_MAPPINGS を先頭から調べ、部分一致した最初の統一先を返す"""
+    for key, value in LABEL_MAPPINGS.items():
+        if key in label or label in key:
+            return value
+    return None
+
+# 「label in key」が成り立つのはキーの部分文字列（空文字を含む）だけなので、
+# その結果は読み込み時にすべて求めておく。残りは「key in label」だけを調べればよい。
+LABEL_NORMALIZATION = {
+    key[start:end]: _match_label_mapping(key[start:end])
+    for key in LABEL_MAPPINGS
+    for start in range(len(key) + 1)
+    for end in range(start, len(key) + 1)
+}
+
 def normalize_label(label):
     """ラベルを正規化して類似ラベルを統一"""
     # ■記号を除去
     label = label.lstrip('■').strip()
 
-    # 類似ラベルを統一
-    label_mappings = {
-        '原材料名': '原材料',
-        '品名': '商品名',
-        '内容量': '容量',
-        '賞味期限': '賞味期限',
-        '保存方法': '保存方法',
-        '販売者': '販売者',
-    }
+    # キーそのもの・キーの部分文字列は表を引くだけで済む
+    mapped = LABEL_NORMALIZATION.get(label)
+    if mapped is not None:
+        return mapped
 
-    # マッピングに一致するものがあれば変換
-    for key, value in label_mappings.items():
-        if key in label or label in key:
+    # キーを含むラベル（例: 賞味期限（製造日から））は統一先に変換
+    for key, value in LABEL_MAPPINGS.items():
+        if key in label:
             return value
 
     return label
@@ -61,9 +158,10 @@ def extract_product_info(pc_text, sp_text):
         return ""
 
     # HTMLタグから情報を抽出
-    # <table>タグの内容を抽出
-    table_pattern = r'<table[^>]*>(.*?)</table>'
-    table_matches = re.findall(table_pattern, text, re.DOTALL | re.IGNORECASE)
+    # splitは [テーブル外, テーブル内容, テーブル外, ...] を返すので、
+    # テーブル内容の抽出とテーブルの削除を1回の走査で済ませる
+    parts = TABLE_PATTERN.split(text)
+    table_matches = parts[1::2]
 
     # 重複を除去：ラベルと値のペアで管理
     seen_items = {}  # {normalized_label: (original_label, value)}
@@ -72,12 +170,11 @@ def extract_product_info(pc_text, sp_text):
     if table_matches:
         table_html = table_matches[0]  # 最初のテーブルのみ使用
         # <tr><th>...</th><td>...</td></tr> 形式から抽出
-        row_pattern = r'<tr[^>]*>.*?<th[^>]*>(.*?)</th>.*?<td[^>]*>(.*?)</td>.*?</tr>'
-        rows = re.findall(row_pattern, table_html, re.DOTALL | re.IGNORECASE)
+        rows = scan_table_rows(table_html)
         for label, value in rows:
             # HTMLタグを除去
-            label = re.sub(r'<[^>]+>', '', label).strip()
-            value = re.sub(r'<[^>]+>', '\n', value).strip()
+            label = TAG_PATTERN.sub('', label).strip()
+            value = TAG_PATTERN.sub('\n', value).strip()
             label = label.lstrip('■')
 
             # ラベルを正規化
@@ -88,32 +185,38 @@ def extract_product_info(pc_text, sp_text):
                 seen_items[normalized_label] = (label, value)
 
     # 栄養成分情報のみを抽出（栄養成分キーワードを含む行のみ）
-    nutrition_keywords = ['エネルギー', 'たんぱく質', 'タンパク質', '脂質', '炭水化物', '食塩', 'ナトリウム', '糖質', '食物繊維']
-
     # テーブル以外のテキストから栄養成分を探す
     # tableタグを削除して残りのテキストを取得
-    text_without_tables = re.sub(r'<table[^>]*>.*?</table>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    text_without_tables = ''.join(parts[0::2])
     # 画像・リンクも削除
-    text_without_tables = re.sub(r'<a[^>]*>.*?</a>', '', text_without_tables, flags=re.DOTALL | re.IGNORECASE)
-    text_without_tables = re.sub(r'<img[^>]*>', '', text_without_tables, flags=re.IGNORECASE)
+    text_without_tables = ANCHOR_PATTERN.sub('', text_without_tables)
+    text_without_tables = IMG_PATTERN.sub('', text_without_tables)
 
     # 全てのHTMLタグを除去
-    clean_text = re.sub(r'<br\s*/?>', '\n', text_without_tables, flags=re.IGNORECASE)
-    clean_text = re.sub(r'<[^>]+>', '\n', clean_text)
+    # <br>もタグとして改行になるが、先に単独で置換しておくことで、属性値などに紛れた
+    # <br>（例: <p title="a<br>b">）があってもタグ全体を1つとして除去できる
+    clean_text = BR_PATTERN.sub('\n', text_without_tables)
+    clean_text = TAG_PATTERN.sub('\n', clean_text)
 
     # 栄養成分行を格納（重複チェック付き）
     seen_nutrition = {}
 
-    # 行ごとに分割
-    lines = clean_text.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
+    # 全行を分割して調べる代わりに、本文全体からキーワードを探し、
+    # 見つかった位置を含む行だけを切り出す（キーワードを含む行はごく一部）
+    pos = 0
+    while True:
+        match = NUTRITION_KEYWORD_PATTERN.search(clean_text, pos)
+        if not match:
+            break
+        line_start = clean_text.rfind('\n', 0, match.start()) + 1
+        line_end = clean_text.find('\n', match.end())
+        if line_end < 0:
+            line_end = len(clean_text)
         # 栄養成分キーワードを含む行のみ追加（重複チェック付き）
-        if any(keyword in line for keyword in nutrition_keywords):
-            if line not in seen_nutrition:
-                seen_nutrition[line] = True
+        line = clean_text[line_start:line_end].strip()
+        if line not in seen_nutrition:
+            seen_nutrition[line] = True
+        pos = line_end + 1
 
     # 結果を組み立て（テーブル項目 + 栄養成分）
     # ■記号を除去してAPIに渡す（APIが自動的にラベルのバリエーションを統一してくれる）
@@ -131,8 +234,6 @@ def extract_product_info(pc_text, sp_text):
 
 def create_product_info_from_dict(data_dict):
     """辞書からProductInfoオブジェクトを直接作成（パーサーをバイパス）"""
-    from generate import ProductInfo
-
     return ProductInfo(
         product_name=data_dict.get('品名', ''),
         ingredients=data_dict.get('原材料', ''),
@@ -156,9 +257,8 @@ def extract_product_dict(pc_text, sp_text):
     if not text:
         return {}
 
-    # HTMLタグから情報を抽出
-    table_pattern = r'<table[^>]*>(.*?)</table>'
-    table_matches = re.findall(table_pattern, text, re.DOTALL | re.IGNORECASE)
+    # HTMLタグから情報を抽出（使うのは最初のテーブルだけなので、見つけた時点で走査を止める）
+    table_match = TABLE_PATTERN.search(text)
 
     # ラベルを正規化して格納
     data_dict = {}
@@ -178,14 +278,13 @@ def extract_product_dict(pc_text, sp_text):
     }
 
     # テーブルから情報抽出
-    if table_matches:
-        table_html = table_matches[0]
-        row_pattern = r'<tr[^>]*>.*?<th[^>]*>(.*?)</th>.*?<td[^>]*>(.*?)</td>.*?</tr>'
-        rows = re.findall(row_pattern, table_html, re.DOTALL | re.IGNORECASE)
+    if table_match:
+        table_html = table_match.group(1)
+        rows = scan_table_rows(table_html)
 
         for label, value in rows:
-            label = re.sub(r'<[^>]+>', '', label).strip().lstrip('■')
-            value = re.sub(r'<[^>]+>', ' ', value).strip()
+            label = TAG_PATTERN.sub('', label).strip().lstrip('■')
+            value = TAG_PATTERN.sub(' ', value).strip()
 
             # ラベルを正規化
             normalized_label = label_map.get(label, None)
@@ -196,11 +295,16 @@ def extract_product_dict(pc_text, sp_text):
 
 def process_row(row_data):
     """1行のデータを処理"""
-    product_code = row_data.get('メインデータの商品コード（楽天URL）', '')
-    product_name = row_data.get('メインデータの商品名', '')
     pc_text = row_data.get('PC用商品説明文', '')
     sp_text = row_data.get('スマートフォン用商品説明文', '')
 
+    # 呼び出し側が書き換えてもキャッシュに影響しないよう、コピーを返す
+    return dict(render_descriptions(pc_text, sp_text))
+
+# 同じ説明文の行（SKU違いなど）は多く、付属のCSVでも405行中117行が重複している
+@lru_cache(maxsize=1024)
+def render_descriptions(pc_text, sp_text):
+    """C列・D列の説明文から4種類のHTMLを生成（結果は説明文ごとにキャッシュ）"""
     # 画像・リンク要素を抽出（楽天版のみ使用）
     rakuten_prefix = extract_images_and_links(sp_text)
 
@@ -218,8 +322,7 @@ def process_row(row_data):
     # ProductInfoオブジェクトを直接作成
     product_info = create_product_info_from_dict(product_dict)
 
-    generator = HTMLGenerator()
-    html_variants = generator.generate_all(product_info)
+    html_variants = _GENERATOR.generate_all(product_info)
 
     # 楽天版には画像・リンクを先頭に追加
     rakuten_pc_html = rakuten_prefix + '\n' + html_variants['rakuten_pc'] if rakuten_prefix else html_variants['rakuten_pc']
@@ -232,53 +335,99 @@ def process_row(row_data):
         'Yahooスマホ': html_variants['yahoo_sp']
     }
 
-def process_csv(input_path, output_path):
-    """CSVファイルを処理"""
-    results = []
-
-    with open(input_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    print(f"処理開始: {len(rows)}行")
-
-    for idx, row in enumerate(rows, 1):
-        print(f"処理中: {idx}/{len(rows)} - {row.get('メインデータの商品名', '')[:30]}...")
-
-        try:
-            html_results = process_row(row)
-            row.update(html_results)
-            results.append(row)
-        except Exception as e:
-            print(f"エラー (行{idx}): {str(e)}")
-            row.update({
-                '楽天パソコン': f'<!-- エラー: {str(e)} -->',
-                '楽天スマホ': f'<!-- エラー: {str(e)} -->',
-                'Yahooパソコン': f'<!-- エラー: {str(e)} -->',
-                'Yahooスマホ': f'<!-- エラー: {str(e)} -->'
-            })
-            results.append(row)
-
-    # 結果をCSVに書き込み
-    if results:
-        fieldnames = list(results[0].keys())
-        with open(output_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
+OUTPUT_COLUMNS = ['楽天パソコン', '楽天スマホ', 'Yahooパソコン', 'Yahooスマホ']
+
+# 並列処理時に1ワーカーへまとめて渡す行数
+CHUNK_SIZE = 16
+
+def process_row_safe(row_data):
+    """1行を処理し、(HTML列の辞書, エラーメッセージ) を返す（ワーカープロセスからも呼ぶ）"""
+    try:
+        return process_row(row_data), None
+    except Exception as e:
+        return {column: f'<!-- エラー: {str(e)} -->' for column in OUTPUT_COLUMNS}, str(e)
+
+def iter_processed_rows(rows, workers=1):
+    """行を順番どおりに処理して (行, HTML列, エラー) を返す"""
+    if workers <= 1:
+        for row in rows:
+            yield (row, *process_row_safe(row))
+        return
+
+    # Executor.mapは渡した行を一度に全部投入するため、読み込みは一定量ずつに区切る
+    batch_size = workers * CHUNK_SIZE * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            for row, (html_results, error) in zip(
+                batch, executor.map(process_row_safe, batch, chunksize=CHUNK_SIZE)
+            ):
+                yield row, html_results, error
+
+def process_csv(input_path, output_path, workers=1, viewer_html_path=None):
+    """CSVファイルを1行ずつ処理して書き出し、処理した行数を返す
+
+    workersに2以上を指定すると、行の処理を複数プロセスに分散する。
+    viewer_html_pathを指定すると、出力CSVを読み直さずに同じ行からビューアーも書き出す。
+    """
+    count = 0
+
+    # 全行をメモリに持たず、読み込んだ行から順に書き出す
+    with ExitStack() as stack:
+        f_in = stack.enter_context(open(input_path, 'r', encoding='utf-8'))
+        f_out = stack.enter_context(open(output_path, 'w', encoding='utf-8', newline=''))
+        f_view = None
+        if viewer_html_path:
+            f_view = stack.enter_context(open(viewer_html_path, 'w', encoding='utf-8'))
+            f_view.write(VIEWER_HEADER)
+
+        reader = csv.DictReader(f_in)
+        input_fields = reader.fieldnames or []
+        fieldnames = input_fields + [c for c in OUTPUT_COLUMNS if c not in input_fields]
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer.writeheader()
+
+        # 総行数を数えるために全体を先読みせず、読み込んだバイト数から進捗を概算する
+        # （説明文は改行を含むので、物理行数は行数の目安にならない）
+        total_bytes = os.path.getsize(input_path)
+        print(f"処理開始: {input_path} ({total_bytes:,}バイト)")
+
+        def merged_rows():
+            nonlocal count
+            for idx, (row, html_results, error) in enumerate(iter_processed_rows(reader, workers), 1):
+                percent = f_in.buffer.tell() * 100 // total_bytes if total_bytes else 100
+                print(f"処理中: {idx}行目 (約{percent}%) - {row.get('メインデータの商品名', '')[:30]}...")
+                if error is not None:
+                    print(f"エラー (行{idx}): {error}")
+                row.update(html_results)
+                if f_view is not None:
+                    f_view.write(render_viewer_row(idx, row))
+                count = idx
+                yield row
+
+        # writerowsはジェネレーターを1行ずつ消費するので、結果の行は溜まらない
+        writer.writerows(merged_rows())
+        if f_view is not None:
+            f_view.write(VIEWER_FOOTER)
+            print(f"ビューアーを生成しました: {viewer_html_path}")
 
     print(f"完了: {output_path}")
-    return results
+    return count
 
 if __name__ == '__main__':
-    script_dir = Path(__file__).parent
-    input_csv = script_dir.parent / '無題のスプレッドシート のコピー - ir-itemsub_楽天_美味セレクト楽天市場店 (9).csv'
-    output_csv = script_dir / 'output_result.csv'
+    arg_parser = argparse.ArgumentParser(description='CSVから楽天・Yahoo!用のHTMLを生成')
+    arg_parser.add_argument('--workers', type=int, default=1, help='並列処理のプロセス数（既定: 1）')
+    args = arg_parser.parse_args()
+
+    input_csv = DEFAULT_INPUT_CSV
+    output_csv = DEFAULT_OUTPUT_CSV
 
     if not input_csv.exists():
         print(f"エラー: 入力ファイルが見つかりません: {input_csv}")
         sys.exit(1)
 
-    results = process_csv(str(input_csv), str(output_csv))
-    print(f"\n処理完了: {len(results)}行")
+    count = process_csv(str(input_csv), str(output_csv), workers=args.workers)
+    print(f"\n処理完了: {count}行")
     print(f"出力ファイル: {output_csv}")
@@ -3,44 +3,35 @@
 """
 CSV処理とビューアー生成を一括実行
 """
-import subprocess
-import sys
-from pathlib import Path
 import webbrowser
 
-def main():
-    script_dir = Path(__file__).parent
+from process_csv import DEFAULT_INPUT_CSV, DEFAULT_OUTPUT_CSV, DEFAULT_VIEWER_HTML, process_csv
 
+def main():
     print("=" * 60)
     print("CSV処理ツール - 一括実行")
     print("=" * 60)
 
-    # Step 1: CSV処理
-    print("\n[Step 1/2] CSVファイルを処理中...")
-    process_script = script_dir / 'process_csv.py'
-    result = subprocess.run([sys.executable, str(process_script)])
-
-    if result.returncode != 0:
-        print("\nエラー: CSV処理に失敗しました")
+    if not DEFAULT_INPUT_CSV.exists():
+        print(f"\nエラー: 入力ファイルが見つかりません: {DEFAULT_INPUT_CSV}")
         return
 
-    # Step 2: ビューアー生成
-    print("\n[Step 2/2] ビューアーを生成中...")
-    viewer_script = script_dir / 'generate_viewer.py'
-    result = subprocess.run([sys.executable, str(viewer_script)])
-
-    if result.returncode != 0:
-        print("\nエラー: ビューアー生成に失敗しました")
+    # CSV処理とビューアー生成を同じプロセスで1回の読み込みで行う
+    # （以前は2つのスクリプトを別プロセスで起動し、出力CSVを読み直していた）
+    print("\nCSVファイルを処理し、ビューアーを生成中...")
+    viewer_html = DEFAULT_VIEWER_HTML
+    try:
+        process_csv(str(DEFAULT_INPUT_CSV), str(DEFAULT_OUTPUT_CSV), viewer_html_path=str(viewer_html))
+    except Exception as e:
+        print(f"\nエラー: CSV処理に失敗しました: {e}")
         return
 
-    # ブラウザで開く
-    viewer_html = script_dir / 'viewer.html'
     if viewer_html.exists():
         print("\n" + "=" * 60)
         print("✅ 完了しました！")
         print("=" * 60)
         print(f"\n出力ファイル:")
-        print(f"  - CSV: {script_dir / 'output_result.csv'}")
+        print(f"  - CSV: {DEFAULT_OUTPUT_CSV}")
         print(f"  - HTML: {viewer_html}")
 
         print("\nブラウザでビューアーを開きます...")
@@ -8,7 +8,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'api'))
 from generate import FlexibleParser, HTMLGenerator
 
 # テストテキスト（■記号なし）
-test_text = """品名:宇治抹茶
+TEST_TEXT = """品名:宇治抹茶
 
 原材料名:緑茶(国産)
 
@@ -21,31 +21,36 @@ test_text = """品名:宇治抹茶
 販売者:株式会社天然生活
 〒141-0032　東京都品川区大崎3-6-4　トキワビル7F"""
 
-print("=== テスト入力 ===")
-print(test_text)
-print("\n")
-
-parser = FlexibleParser()
-product_info = parser.parse(test_text)
-
-print("=== パース結果 ===")
-print(f"product_name: {product_info.product_name}")
-print(f"ingredients: {product_info.ingredients}")
-print(f"content: {product_info.content}")
-print(f"expiry: {product_info.expiry}")
-print(f"storage: {product_info.storage}")
-print(f"seller: {product_info.seller}")
-print(f"extra_fields: {product_info.extra_fields}")
-print("\n")
-
-generator = HTMLGenerator()
-html_variants = generator.generate_all(product_info)
-
-yahoo_pc = html_variants['yahoo_pc']
-print("=== Yahoo PC HTML ===")
-print(yahoo_pc)
-print("\n")
-
-print("=== 重複チェック ===")
-print(f"原材料の出現回数: {yahoo_pc.count('原材料')}")
-print(f"内容量の出現回数: {yahoo_pc.count('内容量')}")
+def main():
+    """パース結果とYahoo PC用HTMLを表示して、項目の重複を目視確認する"""
+    print("=== テスト入力 ===")
+    print(TEST_TEXT)
+    print("\n")
+
+    parser = FlexibleParser()
+    product_info = parser.parse(TEST_TEXT)
+
+    print("=== パース結果 ===")
+    print(f"product_name: {product_info.product_name}")
+    print(f"ingredients: {product_info.ingredients}")
+    print(f"content: {product_info.content}")
+    print(f"expiry: {product_info.expiry}")
+    print(f"storage: {product_info.storage}")
+    print(f"seller: {product_info.seller}")
+    print(f"extra_fields: {product_info.extra_fields}")
+    print("\n")
+
+    generator = HTMLGenerator()
+    html_variants = generator.generate_all(product_info)
+
+    yahoo_pc = html_variants['yahoo_pc']
+    print("=== Yahoo PC HTML ===")
+    print(yahoo_pc)
+    print("\n")
+
+    print("=== 重複チェック ===")
+    print(f"原材料の出現回数: {yahoo_pc.count('原材料')}")
+    print(f"内容量の出現回数: {yahoo_pc.count('内容量')}")
+
+if __name__ == '__main__':
+    main()
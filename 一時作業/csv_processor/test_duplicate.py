@@ -1,129 +1,261 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys
+import argparse
 import csv
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
-# 親ディレクトリのapiモジュールをインポート
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'api'))
+SCRIPT_DIR = Path(__file__).parent
+INPUT_CSV = SCRIPT_DIR.parent / '無題のスプレッドシート のコピー - ir-itemsub_楽天_美味セレクト楽天市場店 (9).csv'
+
+# 使うパターンは読み込み時に一度だけコンパイルする
+TABLE_PATTERN = re.compile(r'<table[^>]*>(.*?)</table>', re.DOTALL | re.IGNORECASE)
+TABLE_ROW_PATTERN = re.compile(r'<tr[^>]*>.*?<th[^>]*>(.*?)</th>.*?<td[^>]*>(.*?)</td>.*?</tr>', re.DOTALL | re.IGNORECASE)
+ANCHOR_PATTERN = re.compile(r'<a[^>]*>.*?</a>', re.DOTALL | re.IGNORECASE)
+IMG_PATTERN = re.compile(r'<img[^>]*>', re.IGNORECASE)
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# 栄養成分の行とみなすキーワード（1回のsearchでまとめて判定する）
+# 正規表現の選択肢の順序を固定するため、frozensetではなくタプルにしている
+NUTRITION_KEYWORDS = ('エネルギー', 'たんぱく質', 'タンパク質', '脂質', '炭水化物', '食塩', 'ナトリウム', '糖質', '食物繊維')
+NUTRITION_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, NUTRITION_KEYWORDS)))
+
+# 類似ラベルの統一先
+LABEL_MAPPINGS = {
+    '原材料名': '原材料',
+    '品名': '商品名',
+    '内容量': '容量',
+    '賞味期限': '賞味期限',
+    '保存方法': '保存方法',
+    '販売者': '販売者',
+}
+
+def _match_label_mapping(label):
+    """LABEL_MAPPINGS を先頭から調べ、部分一致した最初の統一先を返す"""
+    for key, value in LABEL_MAPPINGS.items():
+        if key in label or label in key:
+            return value
+    return None
+
+# キーの部分文字列（空文字を含む）の統一先は読み込み時にすべて求めておく
+LABEL_NORMALIZATION = {
+    key[start:end]: _match_label_mapping(key[start:end])
+    for key in LABEL_MAPPINGS
+    for start in range(len(key) + 1)
+    for end in range(start, len(key) + 1)
+}
 
 def normalize_label(label):
     """ラベルを正規化して類似ラベルを統一"""
     # ■記号を除去
     label = label.lstrip('■').strip()
 
-    # 類似ラベルを統一
-    label_mappings = {
-        '原材料名': '原材料',
-        '品名': '商品名',
-        '内容量': '容量',
-        '賞味期限': '賞味期限',
-        '保存方法': '保存方法',
-        '販売者': '販売者',
-    }
-
-    # マッピングに一致するものがあれば変換
-    for key, value in label_mappings.items():
-        if key in label or label in key:
+    # キーそのもの・キーの部分文字列は表を引くだけで済む
+    mapped = LABEL_NORMALIZATION.get(label)
+    if mapped is not None:
+        return mapped
+
+    # キーを含むラベル（例: 賞味期限（製造日から））は統一先に変換
+    for key, value in LABEL_MAPPINGS.items():
+        if key in label:
             return value
 
     return label
 
-def extract_product_info(pc_text, sp_text):
-    """C列とD列から商品情報テキストを抽出（画像・リンクを除く）"""
+def strip_tags(text, sep=''):
+    """HTMLタグを sep に置き換える（タグのないセルは正規表現を通さずそのまま返す）"""
+    return TAG_PATTERN.sub(sep, text) if '<' in text else text
+
+def extract_product_info(pc_text, sp_text, debug=False):
+    """C列とD列から商品情報テキストを抽出（画像・リンクを除く）
+
+    debug=True のときだけ、テーブル各行の正規化結果と重複判定を出力する。
+    """
     # SP版のテキストを優先的に使用
     text = sp_text if sp_text else pc_text
 
     if not text:
         return ""
 
+    # タグもキーワードもなければテーブル項目・栄養成分とも見つからない
+    if '<' not in text and not NUTRITION_KEYWORD_PATTERN.search(text):
+        return ""
+
     # HTMLタグから情報を抽出
-    # <table>タグの内容を抽出
-    table_pattern = r'<table[^>]*>(.*?)</table>'
-    table_matches = re.findall(table_pattern, text, re.DOTALL | re.IGNORECASE)
+    # splitは [テーブル外, テーブル内容, テーブル外, ...] を返すので、
+    # テーブル内容の抽出とテーブルの削除を1回の走査で済ませる
+    parts = TABLE_PATTERN.split(text)
 
     # 重複を除去：ラベルと値のペアで管理
     seen_items = {}  # {normalized_label: (original_label, value)}
 
     # テーブルから情報抽出（最初のテーブルのみ - 商品情報テーブル）
-    if table_matches:
-        table_html = table_matches[0]  # 最初のテーブルのみ使用
-        # <tr><th>...</th><td>...</td></tr> 形式から抽出
-        row_pattern = r'<tr[^>]*>.*?<th[^>]*>(.*?)</th>.*?<td[^>]*>(.*?)</td>.*?</tr>'
-        rows = re.findall(row_pattern, table_html, re.DOTALL | re.IGNORECASE)
-
-        print(f"\n=== テーブルから抽出された行: {len(rows)}個 ===")
+    if len(parts) > 1:
+        table_html = parts[1]  # 最初のテーブルのみ使用（他のテーブルの内容は取り出さない）
+        # デバッグ出力は行ごとに print せず、まとめて1回で書き出す
+        debug_lines = [] if debug else None
+        row_count = 0
 
-        for label, value in rows:
+        # <tr><th>...</th><td>...</td></tr> 形式から1行ずつ抽出（行のリストは作らない）
+        for row_match in TABLE_ROW_PATTERN.finditer(table_html):
+            label, value = row_match.groups()
+            row_count += 1
             # HTMLタグを除去
-            label = re.sub(r'<[^>]+>', '', label).strip()
-            value = re.sub(r'<[^>]+>', '\n', value).strip()
-            label = label.lstrip('■')
+            # ■の除去は表示用ラベルのために必要（normalize_label内の除去は正規化用）
+            label = strip_tags(label).strip().lstrip('■')
+            value = strip_tags(value, '\n').strip()
 
             # ラベルを正規化
             normalized_label = normalize_label(label)
 
-            print(f"元ラベル: {repr(label)} -> 正規化: {repr(normalized_label)}")
-
             # 正規化されたラベルで重複チェック
-            if normalized_label not in seen_items:
+            is_new = normalized_label not in seen_items
+            if is_new:
                 seen_items[normalized_label] = (label, value)
-                print(f"  → 追加")
-            else:
-                print(f"  → 重複のためスキップ")
 
-    # 栄養成分情報のみを抽出（栄養成分キーワードを含む行のみ）
-    nutrition_keywords = ['エネルギー', 'たんぱく質', 'タンパク質', '脂質', '炭水化物', '食塩', 'ナトリウム', '糖質', '食物繊維']
+            if debug:
+                debug_lines.append(f"元ラベル: {repr(label)} -> 正規化: {repr(normalized_label)}")
+                debug_lines.append("  → 追加" if is_new else "  → 重複のためスキップ")
 
+        if debug:
+            # 行数は走査が終わるまで分からないので、見出しは最後に付ける
+            print(f"\n=== テーブルから抽出された行: {row_count}個 ===")
+            if debug_lines:
+                print('\n'.join(debug_lines))
+
+    # 栄養成分情報のみを抽出（栄養成分キーワードを含む行のみ）
     # テーブル以外のテキストから栄養成分を探す
-    # tableタグを削除して残りのテキストを取得
-    text_without_tables = re.sub(r'<table[^>]*>.*?</table>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    # tableタグを削除した残りのテキスト（splitの偶数番目）
+    text_without_tables = ''.join(parts[0::2])
     # 画像・リンクも削除
-    text_without_tables = re.sub(r'<a[^>]*>.*?</a>', '', text_without_tables, flags=re.DOTALL | re.IGNORECASE)
-    text_without_tables = re.sub(r'<img[^>]*>', '', text_without_tables, flags=re.IGNORECASE)
-
-    # 全てのHTMLタグを除去
-    clean_text = re.sub(r'<br\s*/?>', '\n', text_without_tables, flags=re.IGNORECASE)
-    clean_text = re.sub(r'<[^>]+>', '\n', clean_text)
+    text_without_tables = ANCHOR_PATTERN.sub('', text_without_tables)
+    text_without_tables = IMG_PATTERN.sub('', text_without_tables)
 
     # 栄養成分行を格納（重複チェック付き）
+    # 出力順を保つため set ではなく値を持たない dict を使う
     seen_nutrition = {}
 
-    # 行ごとに分割
-    lines = clean_text.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        # 栄養成分キーワードを含む行のみ追加（重複チェック付き）
-        if any(keyword in line for keyword in nutrition_keywords):
-            if line not in seen_nutrition:
-                seen_nutrition[line] = True
+    # キーワードがなければタグの除去も行の切り出しも不要
+    # （元の本文ではなく、テーブル・画像・リンクを除いた後の文字列で調べる。
+    #   これらは空文字に置き換わるので、前後がつながってキーワードになることがある）
+    if NUTRITION_KEYWORD_PATTERN.search(text_without_tables):
+        # 全てのHTMLタグを除去
+        # ほとんどの<br>はこの表記なので文字列置換で済ませ、
+        # それ以外の表記（<br >, <BR/> など）が残っているときだけ元の文字列を正規表現で置換する
+        # （置換後の文字列に適用すると、入れた改行が \s にマッチしてしまう）
+        clean_text = text_without_tables.replace('<br>', '\n')
+        if '<br' in clean_text or '<BR' in clean_text or '<Br' in clean_text or '<bR' in clean_text:
+            clean_text = BR_PATTERN.sub('\n', text_without_tables)
+        clean_text = TAG_PATTERN.sub('\n', clean_text)
 
-    # 結果を組み立て（テーブル項目 + 栄養成分）
-    result_parts = []
-    for normalized_label, (original_label, value) in seen_items.items():
-        result_parts.append(f"■{original_label}:{value}")
+        # 全行を分割して調べる代わりに、本文全体からキーワードを探し、
+        # 見つかった位置を含む行だけを切り出す
+        pos = 0
+        while True:
+            match = NUTRITION_KEYWORD_PATTERN.search(clean_text, pos)
+            if not match:
+                break
+            line_start = clean_text.rfind('\n', 0, match.start()) + 1
+            line_end = clean_text.find('\n', match.end())
+            if line_end < 0:
+                line_end = len(clean_text)
+            # 栄養成分キーワードを含む行のみ追加（既にある行は最初の位置のまま）
+            seen_nutrition[clean_text[line_start:line_end].strip()] = None
+            pos = line_end + 1
 
-    result_parts.extend(seen_nutrition.keys())
+    # 結果を組み立て（テーブル項目 + 栄養成分）
+    result_parts = ['■' + original_label + ':' + value for original_label, value in seen_items.values()]
+    result_parts.extend(seen_nutrition)
 
     return '\n\n'.join(result_parts)
 
 # テスト実行
-input_csv = Path(__file__).parent.parent / '無題のスプレッドシート のコピー - ir-itemsub_楽天_美味セレクト楽天市場店 (9).csv'
+def iter_descriptions(f):
+    """CSVから (PC用商品説明文, スマートフォン用商品説明文) の組を1行ずつ返す"""
+    # 使うのは2列だけなので、行ごとにdictを作らず列番号で取り出す
+    reader = csv.reader(f)
+    header = next(reader)
+    pc_index = header.index('PC用商品説明文')
+    sp_index = header.index('スマートフォン用商品説明文')
+    for row in reader:
+        # 空行は csv.reader では [] になる（DictReaderと同じく読み飛ばす）
+        if not row:
+            continue
+        # 列が足りない行は、足りない列を空文字として扱う
+        yield (
+            row[pc_index] if pc_index < len(row) else '',
+            row[sp_index] if sp_index < len(row) else '',
+        )
+
+def check_first_row():
+    """先頭の1行だけを詳細出力付きで確認する"""
+    with open(INPUT_CSV, 'r', encoding='utf-8') as f:
+        pc_text, sp_text = next(iter_descriptions(f))
+
+    result = extract_product_info(pc_text, sp_text, debug=True)
+
+    print('\n\n=== extract_product_infoの戻り値 ===')
+    print(result)
+    print('\n=== 統計 ===')
+    print(f'「内容量」の出現回数: {result.count("内容量")}')
+    print(f'「原材料」の出現回数: {result.count("原材料")}')
+
+CHUNK_SIZE = 16
+
+# 同じ説明文の行（SKU違いなど）は多いので、結果は説明文の組ごとにキャッシュする
+@lru_cache(maxsize=1024)
+def extract_description_pair(pair):
+    """(PC用, SP用) の組を受け取って extract_product_info を呼ぶ（ワーカープロセスからも呼ぶ）"""
+    return extract_product_info(*pair)
+
+def iter_extracted(pairs, workers=1):
+    """説明文の組を順番どおりに処理して extract_product_info の結果を返す"""
+    if workers <= 1:
+        for pair in pairs:
+            yield extract_description_pair(pair)
+        return
+
+    # Executor.mapは渡した組を一度に全部投入するため、読み込みは一定量ずつに区切る
+    batch_size = workers * CHUNK_SIZE * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            yield from executor.map(extract_description_pair, batch, chunksize=CHUNK_SIZE)
+
+def check_all_rows(workers=1):
+    """CSVの全行を1行ずつ読みながら処理し、ラベルが重複して残った行数を集計する"""
+    total = 0
+    duplicated = {'内容量': 0, '原材料': 0}
+
+    with open(INPUT_CSV, 'r', encoding='utf-8', newline='') as f:
+        for result in iter_extracted(iter_descriptions(f), workers):
+            total += 1
+            for word in duplicated:
+                if result.count(word) > 1:
+                    duplicated[word] += 1
 
-with open(input_csv, 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    row = next(reader)
+    print(f'=== 全{total}行の統計 ===')
+    for word, count in duplicated.items():
+        print(f'「{word}」が2回以上出現した行: {count}')
 
-pc_text = row.get('PC用商品説明文', '')
-sp_text = row.get('スマートフォン用商品説明文', '')
+def main():
+    parser = argparse.ArgumentParser(description='extract_product_info の重複除去を確認する')
+    parser.add_argument('--all', action='store_true',
+                        help='先頭行だけでなくCSVの全行を処理して集計する')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='--all のときの並列処理のプロセス数（既定: 1）')
+    args = parser.parse_args()
 
-result = extract_product_info(pc_text, sp_text)
+    if args.all:
+        check_all_rows(args.workers)
+    else:
+        check_first_row()
 
-print('\n\n=== extract_product_infoの戻り値 ===')
-print(result)
-print('\n=== 統計 ===')
-print(f'「内容量」の出現回数: {result.count("内容量")}')
-print(f'「原材料」の出現回数: {result.count("原材料")}')
+if __name__ == '__main__':
+    main()